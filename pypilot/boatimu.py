@@ -158,7 +158,8 @@ class IMU(object):
             data['compass_calibration_updated'] = True
             self.compass_calibration_updated = False
 
-        self.lastdata = list(data['gyro']), list(data['compass'])
+        # keep references, the data is not modified after it is read
+        self.lastdata = data['gyro'], data['compass']
         return data
 
     def poll(self):
@@ -18,7 +18,9 @@ try:
 
         self.socket = connection
         self.address = address
-        self.out_buffer = ''
+        # pending writes are joined once when flushed
+        self.out_buffer = []
+        self.out_buffer_len = 0
 
         self.udp_port = False
         self.udp_out_buffer = ''
@@ -55,10 +57,12 @@ try:
             print('overflow in pypilot udp socket', self.address, len(self.udp_out_buffer))
             self.udp_out_buffer = ''
         else:
-          self.out_buffer += data
-          if len(self.out_buffer) > 65536:
-            print('overflow in pypilot socket', self.address, len(self.out_buffer), os.getpid())
-            self.out_buffer = ''
+          self.out_buffer.append(data)
+          self.out_buffer_len += len(data)
+          if self.out_buffer_len > 65536:
+            print('overflow in pypilot socket', self.address, self.out_buffer_len, os.getpid())
+            self.out_buffer = []
+            self.out_buffer_len = 0
             self.close()
     
     def flush(self):
@@ -84,16 +88,19 @@ try:
                     self.socket.close()
                     return
   
+            data = ''.join(self.out_buffer)
             t0 = time.monotonic()
-            count = self.socket.send(self.out_buffer.encode())
+            count = self.socket.send(data.encode())
             t1 = time.monotonic()
 
             if t1-t0 > .03:
-                print('socket send took too long!?!?', self.address, t1-t0, len(self.out_buffer))
+                print('socket send took too long!?!?', self.address, t1-t0, len(data))
             if count < 0:
                 print('socket send error', self.address, count)
                 self.socket.close()
-            self.out_buffer = self.out_buffer[count:]
+            data = data[count:]
+            self.out_buffer = [data] if data else []
+            self.out_buffer_len = len(data)
         except Exception as e:
             print('pypilot socket exception', self.address, e, os.getpid(), self.socket)
             self.close()
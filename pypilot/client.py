@@ -210,18 +210,9 @@ class pypilotClient(object):
                     time.sleep(timeout)
                 return
             
-        # inform server of any watches we have changed
-        if self.wwatches:
-            self.connection.write('watch=' + pyjson.dumps(self.wwatches) + '\n')
-            #print('watch', watches, self.wwatches, self.watches)
-            self.wwatches = {}
-
-        # send any delayed watched values
-        self.values.send_watches()
+        self.flush()
 
         if self.connection.fileno():
-            # flush output
-            self.connection.flush()
             try:
                 events = self.poller.poll(int(1000 * timeout))
             except Exception as e:
@@ -264,6 +255,24 @@ class pypilotClient(object):
             else:
                 self.received.append((name, value)) # remote value
 
+    # send everything written since the last poll in one write
+    def flush(self):
+        if not self.connection:
+            return
+
+        # inform server of any watches we have changed
+        if self.wwatches:
+            self.connection.write('watch=' + pyjson.dumps(self.wwatches) + '\n')
+            #print('watch', watches, self.wwatches, self.watches)
+            self.wwatches = {}
+
+        # send any delayed watched values
+        self.values.send_watches()
+
+        if self.connection.fileno():
+            # flush output
+            self.connection.flush()
+
     # polls at least as long as timeout
     def disconnect(self):
         if self.connection:
@@ -312,12 +321,12 @@ class pypilotClient(object):
         return False
 
     def receive(self, timeout=0):
+        return dict(self.receive_pairs(timeout))
+
+    # received (name, value) in arrival order, without building a dict
+    def receive_pairs(self, timeout=0):
         self.poll(timeout)
-        ret = {}
-        for msg in self.received:
-            name, value = msg
-            ret[name] = value
-        self.received = []
+        ret, self.received = self.received, []
         return ret
 
     def send(self, msg):
@@ -6,10 +6,13 @@
  * version 3 of the License, or (at your option) any later version.
  */
 
+#include <Python.h>
+
 #include <stdio.h>
 #include <stdlib.h>
 #include <unistd.h>
 #include <string.h>
+#include <math.h>
 
 #include "linebuffer.h"
 
@@ -119,3 +122,203 @@ int LineBuffer::readline_buf()
     }
     return 0;
 }
+
+// parse nmea sentences in c++ for efficiency
+// returns the same results as the python parsers in nmea.py
+
+#define MAX_NMEA_FIELDS 16
+#define NMEA_SID(a, b, c) ((unsigned char)(a) | (unsigned char)(b)<<8 | (unsigned char)(c)<<16)
+
+struct nmea_field {
+    const char *s;
+    int len;
+};
+
+// split [p, end) on commas the same way the python parsers use str.split
+static int nmea_fields(const char *p, const char *end, nmea_field *fields)
+{
+    int count = 0;
+    while(count < MAX_NMEA_FIELDS) {
+        const char *s = p;
+        while(p < end && *p != ',')
+            p++;
+        fields[count].s = s;
+        fields[count].len = p - s;
+        count++;
+        if(p >= end)
+            break;
+        p++; // skip comma
+    }
+    return count;
+}
+
+// only plain decimal numbers, strtod alone would also take
+// hex, inf/nan and leading whitespace which python float() treats differently
+static bool field_float(const nmea_field &field, double &value)
+{
+    char buf[32];
+    if(field.len == 0 || field.len >= (int)sizeof buf)
+        return false;
+    for(int i=0; i<field.len; i++) {
+        char c = field.s[i];
+        if(!((c >= '0' && c <= '9') || c == '.' || c == '+' || c == '-' || c == 'e' || c == 'E'))
+            return false;
+    }
+    memcpy(buf, field.s, field.len);
+    buf[field.len] = 0;
+    char *end;
+    value = strtod(buf, &end);
+    return end != buf && *end == 0;
+}
+
+static bool field_equals(const nmea_field &field, char c)
+{
+    return field.len == 1 && field.s[0] == c;
+}
+
+static void dict_set_float(PyObject *dict, const char *key, double value)
+{
+    PyObject *o = PyFloat_FromDouble(value);
+    PyDict_SetItemString(dict, key, o);
+    Py_DECREF(o);
+}
+
+static void dict_set_string(PyObject *dict, const char *key, const char *value, int len)
+{
+    PyObject *o = PyUnicode_FromStringAndSize(value, len);
+    PyDict_SetItemString(dict, key, o);
+    Py_DECREF(o);
+}
+
+// (name, msg) tuple, takes the reference to msg
+static PyObject *nmea_result(const char *name, PyObject *msg)
+{
+    return Py_BuildValue("(sN)", name, msg);
+}
+
+static double degrees_minutes_to_decimal(double n)
+{
+    double degrees = floor(n / 100);
+    return degrees + (n - degrees*100) / 60;
+}
+
+static PyObject *nmea_parse_gps(const char *line, nmea_field *data, int count)
+{
+    if(count > 1 && field_equals(data[1], 'V'))
+        Py_RETURN_FALSE;
+
+    double timestamp, lat, lon, speed = 0, track;
+    if(count < 8 || !field_float(data[0], timestamp) ||
+       !field_float(data[2], lat) || !field_float(data[4], lon) ||
+       (data[6].len && !field_float(data[6], speed)) ||
+       (data[7].len && !field_float(data[7], track))) {
+        PySys_WriteStdout("nmea failed to parse gps %.900s\n", line);
+        Py_RETURN_FALSE;
+    }
+
+    lat = degrees_minutes_to_decimal(lat);
+    if(field_equals(data[3], 'S'))
+        lat = -lat;
+    lon = degrees_minutes_to_decimal(lon);
+    if(field_equals(data[5], 'W'))
+        lon = -lon;
+
+    PyObject *gps = PyDict_New();
+    dict_set_float(gps, "timestamp", timestamp);
+    dict_set_float(gps, "speed", speed);
+    dict_set_float(gps, "lat", lat);
+    dict_set_float(gps, "lon", lon);
+    if(data[7].len)
+        dict_set_float(gps, "track", track);
+    return nmea_result("gps", gps);
+}
+
+static PyObject *nmea_parse_wind(const char *line, nmea_field *data, int count)
+{
+    double direction, speed;
+    if(count < 1 || !field_float(data[0], direction))
+        Py_RETURN_FALSE; // require direction
+
+    if(count < 4 || !field_float(data[2], speed)) {
+        PySys_WriteStdout("nmea failed to parse wind %.900s\n", line);
+        Py_RETURN_FALSE;
+    }
+
+    if(field_equals(data[3], 'K')) // km/h
+        speed *= .53995;
+    else if(field_equals(data[3], 'M')) // m/s
+        speed *= 1.94384;
+
+    PyObject *msg = PyDict_New();
+    dict_set_float(msg, "direction", direction);
+    dict_set_float(msg, "speed", speed);
+    return nmea_result("wind", msg);
+}
+
+static PyObject *nmea_parse_rudder(nmea_field *data, int count)
+{
+    double angle;
+    PyObject *msg = PyDict_New();
+    if(count > 0 && field_float(data[0], angle))
+        dict_set_float(msg, "angle", angle);
+    else
+        PyDict_SetItemString(msg, "angle", Py_False);
+    return nmea_result("rudder", msg);
+}
+
+static PyObject *nmea_parse_apb(const char *line, nmea_field *data, int count)
+{
+    double track, xte;
+    if(count < 14 || !field_float(data[12], track) || !field_float(data[2], xte)) {
+        PySys_WriteStdout("exception parsing apb %.900s\n", line);
+        Py_RETURN_FALSE;
+    }
+
+    if(xte > .15)
+        xte = .15; // maximum 0.15 miles
+    if(field_equals(data[3], 'L'))
+        xte = -xte;
+
+    PyObject *msg = PyDict_New();
+    if(field_equals(data[13], 'M'))
+        dict_set_string(msg, "mode", "compass", 7);
+    else
+        dict_set_string(msg, "mode", "gps", 3);
+    dict_set_float(msg, "track", track);
+    dict_set_float(msg, "xte", xte);
+    dict_set_string(msg, "senderid", line+1, 2);
+    return nmea_result("apb", msg);
+}
+
+PyObject *nmea_parse(const char *line)
+{
+    if(strlen(line) < 6)
+        Py_RETURN_FALSE;
+
+    nmea_field data[MAX_NMEA_FIELDS];
+    int len = strlen(line), count;
+    const char *end = line + len;
+    // RMC and APB fields run from after "$GPRMC," up to "*hh",
+    // MWV and RSA fields follow the first comma to the end of the line
+    const char *body = line + 7, *body_end = end - 3;
+    if(body > body_end)
+        body = body_end = end;
+    const char *comma = strchr(line, ',');
+
+    // dispatch on the 3 character sentence id packed into an integer
+    switch(NMEA_SID(line[3], line[4], line[5])) {
+    case NMEA_SID('R', 'M', 'C'):
+        count = nmea_fields(body, body_end, data);
+        return nmea_parse_gps(line, data, count);
+    case NMEA_SID('M', 'W', 'V'):
+        count = comma ? nmea_fields(comma+1, end, data) : 0;
+        return nmea_parse_wind(line, data, count);
+    case NMEA_SID('R', 'S', 'A'):
+        count = comma ? nmea_fields(comma+1, end, data) : 0;
+        return nmea_parse_rudder(data, count);
+    case NMEA_SID('A', 'P', 'B'):
+        count = nmea_fields(body, body_end, data);
+        return nmea_parse_apb(line, data, count);
+    }
+    Py_RETURN_FALSE;
+}
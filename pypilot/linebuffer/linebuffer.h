@@ -28,3 +28,6 @@ private:
     int b, pos, len;
     char buf[2][16384];
 };
+
+// returns (name, msg) for a parsed nmea sentence, or False
+PyObject *nmea_parse(const char *line);
@@ -14,3 +14,5 @@ public:
     bool recv();
     const char *readline_nmea();
 };
+
+PyObject *nmea_parse(const char *line);
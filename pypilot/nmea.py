@@ -22,8 +22,9 @@
 
 DEFAULT_PORT = 20220
 
-import sys, select, time, socket
-import multiprocessing
+import sys, os, select, time, socket
+import multiprocessing, operator
+from functools import reduce, partial
 import serial
 from client import pypilotClient
 from values import *
@@ -36,33 +37,33 @@ import fcntl
 # these are not defined in python module
 TIOCEXCL = 0x540C
 
-# nmea uses a simple xor checksum
+# nmea uses a simple xor checksum, the $ at the begining
+# of the sentence is not included
 def nmea_cksum(msg):
-    value = 0
-    for c in msg: # skip over the $ at the begining of the sentence
-        value ^= ord(c)
-    return value & 255
+    return reduce(operator.xor, msg.encode(), 0) & 255
+
+# checksum formatted as hex, indexed by value
+nmea_cksum_hex = ['%02X' % value for value in range(256)]
 
 def check_nmea_cksum(line):
-    cksplit = line.split('*')
+    i = line.rfind('*')
+    if i < 1:
+        return False
     try:
-        return nmea_cksum(cksplit[0][1:]) == int(cksplit[1], 16)
+        return nmea_cksum(line[1:i]) == int(line[i+1:i+3], 16)
     except:
         return False
 
-    
-def parse_nmea_gps(line):
-    def degrees_minutes_to_decimal(n):
-        n/=100
-        degrees = int(n)
-        minutes = n - degrees
-        return degrees + minutes*10/6
 
-    if line[3:6] != 'RMC':
-        return False
+# convert nmea ddmm.mmmm to decimal degrees
+def degrees_minutes_to_decimal(n):
+    degrees, minutes = divmod(n, 100)
+    return degrees + minutes/60
 
+def parse_nmea_gps(line):
     try:
-        data = line[7:len(line)-3].split(',')
+        # only split the fields used, date and variation are ignored
+        data = line[7:len(line)-3].split(',', 8)
         if data[1] == 'V':
             return False
         gps = {}
@@ -104,10 +105,7 @@ def parse_nmea_gps(line):
    **  6) Checksum
 '''
 def parse_nmea_wind(line):
-    if line[3:6] != 'MWV':
-        return False
-
-    data = line.split(',')
+    data = line.split(',', 5)
     msg = {}
     try:
         msg['direction'] = float(data[1])
@@ -129,10 +127,7 @@ def parse_nmea_wind(line):
     return 'wind', msg
 
 def parse_nmea_rudder(line):
-    if line[3:6] != 'RSA':
-        return False
-
-    data = line.split(',')
+    data = line.split(',', 2)
     try:
         angle = float(data[1])
     except:
@@ -173,8 +168,6 @@ def parse_nmea_apb(line):
    ** 14) M = Magnetic, T = True
    ** 15) Checksum
         '''
-    if line[3:6] != 'APB':
-        return False
     try:
         data = line[7:len(line)-3].split(',')
         mode = 'compass' if data[13] == 'M' else 'gps'
@@ -188,9 +181,18 @@ def parse_nmea_apb(line):
         print('exception parsing apb', e, line)
         return False
 
-nmea_parsers = {'gps': parse_nmea_gps, 'wind': parse_nmea_wind, 'rudder': parse_nmea_rudder, 'apb': parse_nmea_apb}
+# sentence type -> (sensor name, parser)
+nmea_parsers = {'RMC': ('gps', parse_nmea_gps), 'MWV': ('wind', parse_nmea_wind),
+                'RSA': ('rudder', parse_nmea_rudder), 'APB': ('apb', parse_nmea_apb)}
 
 from pypilot.linebuffer import linebuffer
+# optimized version in c parses all of the above sentences,
+# the python parsers are only used with an older linebuffer module.
+# numeric fields must be plain decimals in c, unlike float() it
+# rejects padding spaces, '_' separators, inf and nan
+if hasattr(linebuffer, 'nmea_parse'):
+    for sentence, (name, parser) in nmea_parsers.items():
+        nmea_parsers[sentence] = name, linebuffer.nmea_parse
 class NMEASerialDevice(object):
     def __init__(self, path):
         self.device = serial.Serial(*path)
@@ -237,12 +239,13 @@ class Nmea(object):
         self.process = self.nmea_bridge.process
         self.pipe = self.nmea_bridge.pipe_out
         self.sockets = False
+        self.nmea_out = [] # sentences sent to the bridge once per poll
 
+        # map each polled fd to the function handling its events
         self.poller = select.poll()
-        self.process_fd = self.pipe.fileno()
-        self.poller.register(self.process_fd, select.POLLIN)
-
-        self.device_fd = {}
+        self.poll_handlers = {}
+        if self.process: # without multiprocessing the pipe is read every poll
+            self.register_poll(self.pipe.fileno(), self.poll_process_pipe)
 
         self.nmea_times = {}
         self.last_imu_time = time.monotonic()
@@ -250,16 +253,40 @@ class Nmea(object):
 
         self.devices = []
         self.devices_lastmsg = {}
+        self.devices_timeout = 0 # earliest time a device may time out
+        self.serial_accept = None
         self.probedevice = None
         self.probeindex = 0
 
         self.start_time = time.monotonic()
+        # report times of each poll stage if processing is too slow
+        self.trace = bool(os.environ.get('PYPILOT_NMEA_TRACE'))
 
     def __del__(self):
         #print('terminate nmea process')
         #self.process.terminate()
         pass
 
+    def register_poll(self, fd, handler):
+        self.poll_handlers[fd] = handler
+        self.poller.register(fd, select.POLLIN)
+
+    def unregister_poll(self, fd):
+        del self.poll_handlers[fd]
+        self.poller.unregister(fd)
+
+    def poll_process_pipe(self, flag, t, serial_msgs):
+        if flag != select.POLLIN:
+            print('nmea got flag for process pipe:', flag)
+        else:
+            self.read_process_pipe()
+
+    def poll_serial_device(self, device, flag, t, serial_msgs):
+        if flag == select.POLLIN:
+            self.read_serial_device(device, t, serial_msgs)
+        else:
+            self.remove_serial_device(device)
+
     def read_process_pipe(self):
       while True:
         msgs = self.pipe.recv()
@@ -272,122 +299,144 @@ class Nmea(object):
                 self.sockets = False
             elif msgs[:10] == 'lostsocket':
                 self.sensors.lostdevice(msgs[4:])
+                self.serial_accept = None
             else:
                 print('unhandled nmea pipe string', msgs)
         else:
             for name in msgs:
                 self.sensors.write(name, msgs[name], 'tcp')
-                
-    def read_serial_device(self, device, serial_msgs):
-        t = time.monotonic()
-        line = device.readline()
-        if not line:
-            return
+            self.serial_accept = None
+
+    def update_serial_accept(self):
+        # only process if
+        # 1) current source is lower priority
+        # 2) we do not have a source yet
+        # 3) this the correct device for this data
+        # sources only change when sensors are written, so rather than
+        # per sentence this is computed at most once per poll
+        self.serial_accept = {}
+        for sentence, (name, parser) in nmea_parsers.items():
+            sensor = self.sensors.sensors[name]
+            if source_priority[sensor.source.value] > source_priority['serial'] or \
+               not sensor.device:
+                self.serial_accept[sentence] = True # any device
+            else:
+                self.serial_accept[sentence] = sensor.device[2:]
+
+    def read_serial_device(self, device, t, serial_msgs):
+        if t - self.devices_lastmsg[device] > 2:
+            # resuming after a warning, its deadline may still be the 15 second
+            # timeout so check again in time to warn if it stalls again
+            self.devices_timeout = min(self.devices_timeout, t + 2)
+        while True: # process all buffered lines, not just the first
+            line = device.readline()
+            if not line:
+                return
+            self.read_serial_line(device, line, t, serial_msgs)
+
+    def read_serial_line(self, device, line, t, serial_msgs):
+        sentence = line[3:6]
         if self.sockets:
-            nmea_name = line[:6]
             # we output mwv and rsa messages after calibration
             # do not relay apb messages
-            if not nmea_name[3:] in ['MWV', 'RSA', 'APB']:
+            if not sentence in ('MWV', 'RSA', 'APB'):
                 # do not output nmea data over tcp faster than 4hz
                 # for each message time
                 # forward nmea lines from serial to tcp
-
+                nmea_name = line[:6]
                 dt = t-self.nmea_times[nmea_name] if nmea_name in self.nmea_times else 1
                 if dt > .25:
-                    self.pipe.send(line)
+                    self.send_nmea(line)
                     self.nmea_times[nmea_name] = t
 
         self.devices_lastmsg[device] = t
-        parsers = []
 
-        # only process if
-        # 1) current source is lower priority
-        # 2) we do not have a source yet
-        # 3) this the correct device for this data
-        for name in nmea_parsers:
-            name_device = self.sensors.sensors[name].device
-            current_source = self.sensors.sensors[name].source.value
-            if source_priority[current_source] > source_priority['serial'] or \
-               not name_device or name_device[2:] == device.path[0]:
-                parsers.append(nmea_parsers[name])
+        if not sentence in nmea_parsers:
+            return
+
+        if self.serial_accept is None:
+            self.update_serial_accept()
+        accept = self.serial_accept[sentence]
+        if accept is not True and accept != device.path[0]:
+            return
 
         # parse the nmea line, and update serial messages
-        for parser in parsers:
-            result = parser(line)
-            if result:
-                name, msg = result
-                if name:
-                    msg['device'] = line[1:3] + device.path[0]
-                    serial_msgs[name] = msg
-                break
+        name, parser = nmea_parsers[sentence]
+        result = parser(line)
+        if result:
+            name, msg = result
+            msg['device'] = line[1:3] + device.path[0]
+            serial_msgs[name] = msg
 
     def remove_serial_device(self, device):
         index = self.devices.index(device)
         print('lost serial nmea%d' % index)
         self.sensors.lostdevice(self.devices[index].path[0])
+        self.serial_accept = None
         self.devices[index] = False
-        self.poller.unregister(device.device.fileno())
+        self.unregister_poll(device.device.fileno())
         del self.devices_lastmsg[device]
         device.close()
             
     def poll(self):
-        t0 = time.monotonic()
+        t0 = time.monotonic() # used as the time for this entire poll
         self.probe_serial()
 
-        t1 = time.monotonic()
+        if self.trace:
+            t1 = time.monotonic()
         # handle tcp nmea messages
         serial_msgs = {}
-        while True:
-            events = self.poller.poll(0)
-            if not events:
-                break
-            while events:
-                event = events.pop()
-                fd, flag = event
-                if fd == self.process_fd:
-                    if flag != select.POLLIN:
-                        print('nmea got flag for process pipe:', flag)
-                    else:
-                        self.read_process_pipe()
-                elif flag == select.POLLIN:
-                    #if flag & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
-                    self.read_serial_device(self.device_fd[fd], serial_msgs)
-                else:
-                    self.remove_serial_device(self.device_fd[fd])
+        if not self.process:
+            self.read_process_pipe()
+        if self.poll_handlers: # no syscall if nothing is registered
+            for fd, flag in self.poller.poll(0):
+                self.poll_handlers[fd](flag, t0, serial_msgs)
 
-        t2 = time.monotonic()
+        if self.trace:
+            t2 = time.monotonic()
         for name in serial_msgs:
             self.sensors.write(name, serial_msgs[name], 'serial')
-        t3 = time.monotonic()
+        self.serial_accept = None # sources may have changed
+        if self.trace:
+            t3 = time.monotonic()
                 
-        for device in self.devices:
-            # timeout serial devices
-            if not device:
-                continue
-            dt = time.monotonic() - self.devices_lastmsg[device]
-            if dt > 2:
-                if dt < 2.3:
-                    print('serial device dt', dt, device.path, 'is another process accessing it?')
-            if dt > 15: # no data for 15 seconds
-                print('serial device timed out', dt, device)
-                self.remove_serial_device(device)
-        t4 = time.monotonic()
+        # timeout serial devices, the devices are only checked once the
+        # earliest timeout is reached since receiving data only delays it
+        if t0 >= self.devices_timeout:
+            self.devices_timeout = t0 + 15
+            for device in self.devices:
+                if not device:
+                    continue
+                lastmsg = self.devices_lastmsg[device]
+                dt = t0 - lastmsg
+                if dt > 2:
+                    if dt < 2.3:
+                        print('serial device dt', dt, device.path, 'is another process accessing it?')
+                    timeout = lastmsg + 15
+                else:
+                    timeout = lastmsg + 2
+                if dt > 15: # no data for 15 seconds
+                    print('serial device timed out', dt, device)
+                    self.remove_serial_device(device)
+                    continue
+                self.devices_timeout = min(self.devices_timeout, timeout)
+        if self.trace:
+            t4 = time.monotonic()
 
         # send imu nmea messages to sockets at 2hz
-        dt = time.monotonic() - self.last_imu_time
+        dt = t0 - self.last_imu_time
         values = self.client.values.values
         if self.sockets:
             if dt > .5 and 'imu.pitch' in values:
                 self.send_nmea('APXDR,A,%.3f,D,PTCH' % values['imu.pitch'].value)
                 self.send_nmea('APXDR,A,%.3f,D,ROLL' % values['imu.roll'].value)
                 self.send_nmea('APHDM,%.3f,M' % values['imu.heading_lowpass'].value)
-                self.last_imu_time = time.monotonic()
+                self.last_imu_time = t0
 
             # should we output gps?  for now no
             # limit to 4hz output of wind and rudder
-            t = time.monotonic()
             for name in ['wind', 'rudder']:
-                dt = t - self.nmea_times[name] if name in self.nmea_times else 1
+                dt = t0 - self.nmea_times[name] if name in self.nmea_times else 1
                 source = self.sensors.sensors[name].source.value
                 # only output to tcp if we have a better source
                 if dt > .25 and source_priority[source] < source_priority['tcp']:
@@ -396,15 +445,22 @@ class Nmea(object):
                         self.send_nmea('APMWV,%.3f,R,%.3f,N,A' % (wind.direction.value, wind.speed.value))
                     elif name == 'rudder':
                         self.send_nmea('APRSA,%.3f,A,,' % self.sensors.rudder.angle.value)
-                    self.nmea_times[name] = t
+                    self.nmea_times[name] = t0
             
-        t5 = time.monotonic()
+        # one pipe write for all outgoing sentences
+        if self.nmea_out:
+            self.pipe.send(self.nmea_out)
+            self.nmea_out = []
+
+        if self.trace:
+            t5 = time.monotonic()
         if not self.nmea_bridge.process:
             self.nmea_bridge.poll()
-        
-        t6 = time.monotonic()
-        if t6 - t0 > .1 and self.start_time - t0 > 1: # report times if processing takes more than 0.1 seconds
-            print('nmea poll times', self.start_time-t0, t1-t0, t2-t1, t3-t2, t4-t3, t5-t4, t6-t5)
+
+        if self.trace:
+            t6 = time.monotonic()
+            if t6 - t0 > .1 and t0 - self.start_time > 1: # report times if processing takes more than 0.1 seconds
+                print('nmea poll times', t0-self.start_time, t1-t0, t2-t1, t3-t2, t4-t3, t5-t4, t6-t5)
             
     def probe_serial(self):
         # probe new nmea data devices
@@ -438,9 +494,9 @@ class Nmea(object):
             else:
                 self.devices.append(self.probedevice)
             fd = self.probedevice.device.fileno()
-            self.device_fd[fd] = self.probedevice
-            self.poller.register(fd, select.POLLIN)
+            self.register_poll(fd, partial(self.poll_serial_device, self.probedevice))
             self.devices_lastmsg[self.probedevice] = time.monotonic()
+            self.devices_timeout = 0
             self.probedevice = None
         elif time.monotonic() - self.probetime > 5:
             #print('nmea serial probe timeout', self.probeindex, index, self.probedevicepath)
@@ -448,7 +504,7 @@ class Nmea(object):
 
 
     def send_nmea(self, msg):
-        self.pipe.send(msg)
+        self.nmea_out.append(msg)
         
 class nmeaBridge(object):
     def __init__(self, server):
@@ -488,6 +544,7 @@ class nmeaBridge(object):
         self.last_values = {'gps.source' : 'none', 'wind.source' : 'none', 'rudder.source': 'none', 'apb.source': 'none'}
         for name in self.last_values:
             self.client.watch(name)
+        self.update_tcp_accept()
         self.addresses = {}
         cnt = 0
 
@@ -510,10 +567,17 @@ class nmeaBridge(object):
         for name in watchlist:
             self.client.watch(name, watch)
 
-    def receive_nmea(self, line, sock):
-        device = 'socket' + str(sock.uid),        
-        parsers = []
+    def update_tcp_accept(self):
+        # optimization to only to parse sentences here that would be discarded
+        # in the main process anyway because they are already handled by a source
+        # with a higher priority than tcp
+        tcp_priority = source_priority['tcp']
+        self.tcp_accept = set()
+        for sentence, (name, parser) in nmea_parsers.items():
+            if source_priority[self.last_values[name + '.source']] >= tcp_priority:
+                self.tcp_accept.add(sentence)
 
+    def receive_nmea(self, line, sock):
         # if we receive a "special" pypilot nmea message from this
         # socket, then mark it to rebroadcast to other nmea sockets
         # normally only nmea data received from serial ports is broadcast
@@ -522,25 +586,21 @@ class nmeaBridge(object):
                 sock.broadcast = True
                 return
         else:
+            data = line + '\r\n' # shared by all sockets
             for s in self.sockets:
                 if s != sock:
-                    s.write(line+'\r\n')
+                    s.write(data)
         
-        # optimization to only to parse sentences here that would be discarded
-        # in the main process anyway because they are already handled by a source
-        # with a higher priority than tcp
-        tcp_priority = source_priority['tcp']
-        for name in nmea_parsers:
-            if source_priority[self.last_values[name + '.source']] >= tcp_priority:
-                parsers.append(nmea_parsers[name])
-
-        for parser in  parsers:
-            result = parser(line)
-            if result:
-                name, msg = result
-                msg['device'] = line[1:3] + device
-                self.msgs[name] = msg
-                return
+        sentence = line[3:6]
+        if not sentence in self.tcp_accept:
+            return
+
+        name, parser = nmea_parsers[sentence]
+        result = parser(line)
+        if result:
+            name, msg = result
+            msg['device'] = line[1:3] + 'socket' + str(sock.uid)
+            self.msgs[name] = msg
 
     def new_socket_connection(self, connection, address):
         max_connections = 10
@@ -623,14 +683,17 @@ class nmeaBridge(object):
 
     def receive_pipe(self):
         while True: # receive all messages in pipe
-            msg = self.pipe.recv()
-            if not msg:
+            msgs = self.pipe.recv()
+            if not msgs:
                 return
-            if msg[0] != '$': # perform checksum in this subprocess
-                msg = '$' + msg + ('*%02X' % nmea_cksum(msg))
-            # relay nmea message from server to all tcp sockets
+            lines = ''
+            for msg in msgs: # list of sentences, one per autopilot poll
+                if msg[0] != '$': # perform checksum in this subprocess
+                    msg = '$' + msg + '*' + nmea_cksum_hex[nmea_cksum(msg)]
+                lines += msg + '\r\n'
+            # relay nmea messages from server to all tcp sockets
             for sock in self.sockets:
-                sock.write(msg + '\r\n')
+                sock.write(lines)
 
     def poll(self, timeout=0):
         t0 = time.monotonic()
@@ -639,8 +702,7 @@ class nmeaBridge(object):
         if t1-t0 > timeout:
             print('poll took too long in nmea process!')
 
-        while events:
-            fd, flag = events.pop()
+        for fd, flag in events:
             sock = self.fd_to_socket[fd]
             if flag & (select.POLLHUP | select.POLLERR | select.POLLNVAL):
                 if sock == self.server:
@@ -686,6 +748,8 @@ class nmeaBridge(object):
         for name in pypilot_msgs:
             value = pypilot_msgs[name]
             self.last_values[name] = value
+        if pypilot_msgs:
+            self.update_tcp_accept()
         #except Exception as e:
         #    print('nmea exception receiving:', e)
         t4 = time.monotonic()
@@ -160,9 +160,8 @@ class PipeNonBlockingPipeEnd(object):
             print('too long write pipe', t1-t0, self.name, len(data))
     
     def send(self, value, block=False):
-        if not self.pollout.poll(0):
-            if not self.sendfailok:
-                print('failed send', self.name)
+        # the pipe is nonblocking, so a full pipe raises rather than
+        # requiring a poll syscall before every write
         t0 = time.time()
         try:
             data = pyjson.dumps(value) + '\n'
@@ -173,6 +172,10 @@ class PipeNonBlockingPipeEnd(object):
             if t2-t0 > .024:
                 print('too long send nonblocking pipe', t1-t0, t2-t1, self.name, len(data))
             return True
+        except BlockingIOError:
+            if not self.sendfailok:
+                print('failed send', self.name)
+            return False
         except Exception as e:
             if not self.sendfailok:
                 print('failed to encode data pipe!', self.name, e)
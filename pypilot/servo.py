@@ -771,11 +771,12 @@ def main():
         client.poll()
         server.poll()
 
-        dt = period - time.monotonic() + lastt
-        if dt > 0 and dt < period:
+        # sleep until the next period so timing does not drift
+        lastt += period
+        dt = lastt - time.monotonic()
+        if dt > 0:
             time.sleep(dt)
-            lastt += period
-        else:
+        elif -dt > period: # fell too far behind to catch up
             lastt = time.monotonic()
 
 if __name__ == '__main__':
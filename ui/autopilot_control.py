@@ -7,12 +7,30 @@
 # License as published by the Free Software Foundation; either
 # version 3 of the License, or (at your option) any later version.  
 
-import wx, sys, subprocess, socket, os, time
+import wx, sys, subprocess, socket, os, time, select, threading, collections
 from pypilot.ui import autopilot_control_ui
 from pypilot.client import *
 
+class AutopilotGainControl(object):
+    # widgets and slider state for one gain
+    __slots__ = ('stname', 'stvalue', 'gauge', 'slider', 'sizer', 'min', 'max',
+                 'value', 'gauge_state', 'sliderval', 'position', 'sent',
+                 'need_update', 'last_change')
+
+    def __init__(self, stname, stvalue, gauge, slider, sizer, min_val, max_val):
+        self.stname, self.stvalue, self.gauge, self.slider, self.sizer = stname, stvalue, gauge, slider, sizer
+        self.min, self.max = min_val, max_val
+        self.value = None # last value received
+        self.gauge_state = None # (position, color) shown on the gauge
+        self.sliderval = 0 # slider position of the received value
+        self.position = 0 # current slider position
+        self.sent = None # slider position the server has
+        self.need_update = False
+        self.last_change = 0
+
 class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
-    ID_MESSAGES = 1000
+    ID_COMMAND = 1000
+    ID_GAINS = 1001
 
     def __init__(self):
         super(AutopilotControl, self).__init__(None)
@@ -27,27 +45,62 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
         self.client = False
 
         self.mode = 'compass'
+        self.command = 0 # last sCommand position
         self.heading_command = 0
+        self.sent_heading_command = 0
         self.heading = 0
         self.lastcommand = False
         self.recv = {}
+        self.unhandled = set()
         self.rudder = False
         self.apenabled = False
         self.tackstate = False
+
+        self.mode_colors = {'compass': wx.GREEN, 'gps': wx.YELLOW,
+                            'wind': wx.BLUE, 'true wind': wx.CYAN}
+        self.mode_radios = {'compass': self.rbCompass, 'gps': self.rbGPS,
+                            'wind': self.rbWind, 'true wind': self.rbTrueWind}
         #self.bCenter.Show(False)
-        self.timer = wx.Timer(self, self.ID_MESSAGES)
-        self.timer.Start(100)
-        self.Bind(wx.EVT_TIMER, self.receive_messages, id=self.ID_MESSAGES)
-        self.init()
 
+        # message name -> handler(value)
+        self.handlers = {'ap.enabled': self.update_enabled,
+                         'rudder.angle': self.update_rudder,
+                         'ap.mode': self.update_mode,
+                         'ap.heading_command': self.update_heading_command,
+                         'ap.pilot': self.update_pilot,
+                         'gps.source': self.update_gps_source,
+                         'wind.source': self.update_wind_source,
+                         'ap.heading': self.update_heading,
+                         'ap.tack.state': self.update_tack_state,
+                         'ap.tack.timeout': self.update_tack_timeout,
+                         'ap.tack.direction': self.update_tack_direction,
+                         'servo.engaged': self.update_engaged,
+                         'servo.flags': self.update_flags,
+                         'servo.controller': self.update_controller,
+                         'servo.current': self.update_current}
+
+        # timers only run while the command or a gain slider is moving,
+        # received messages are handled as they arrive
+        self.command_timer = wx.Timer(self, self.ID_COMMAND)
+        self.Bind(wx.EVT_TIMER, self.command_tick, id=self.ID_COMMAND)
+        self.gain_timer = wx.Timer(self, self.ID_GAINS)
+        self.Bind(wx.EVT_TIMER, self.gain_tick, id=self.ID_GAINS)
+        self.init()
 
     def init(self):
         self.stStatus.SetLabel('No Connection')
         self.client = pypilotClient(self.host)
-        self.client.connect(True)
         self.gains = {}
         self.enumerated = False
 
+        # the client is not thread safe, it is only used from client_thread
+        # so the gui never waits on the network
+        self.requests = collections.deque() # (function, args) run on the client
+        self.received = collections.deque() # messages for the gui
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+
         watchlist = ['ap.enabled', 'ap.mode', 'ap.heading_command',
                           'ap.tack.state', 'ap.tack.timeout', 'ap.tack.direction',
                           'ap.heading', 'ap.pilot',
@@ -55,30 +108,108 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
                           'servo.controller', 'servo.engaged', 'servo.flags',
                           'rudder.angle']
         for name in watchlist:
-            self.client.watch(name)
+            self.watch(name)
+
+        threading.Thread(target=self.client_thread, daemon=True).start()
+
+    def request(self, func, *args):
+        self.requests.append((func, args))
+        try:
+            os.write(self.wake_write, b'\n')
+        except BlockingIOError:
+            pass # already woken
+
+    def set(self, name, value):
+        self.request(self.client.set, name, value)
+
+    def watch(self, name):
+        self.request(self.client.watch, name)
+
+    def client_thread(self):
+        self.client.connect(True)
+        value_list = False
+        while True:
+            while self.requests:
+                func, args = self.requests.popleft()
+                func(*args)
+
+            connection = self.client.connection
+            if not connection:
+                self.client.poll(1) # reconnect
+                continue
+
+            self.client.flush() # all requests in one write
+            if connection.fileno() <= 0:
+                # a failed write closed the socket but left the connection
+                self.client.disconnect()
+                continue
+
+            if not value_list:
+                value_list = self.client.list_values(10)
+                if value_list: # the client keeps updating its own dict
+                    wx.CallAfter(self.enumerate_controls, dict(value_list))
+                continue
+
+            try:
+                select.select([connection.socket, self.wake_read], [], [], 1)
+            except Exception as e:
+                print('autopilot control select failed', e)
+                self.client.disconnect()
+                continue
+
+            try:
+                os.read(self.wake_read, 4096)
+            except BlockingIOError:
+                pass # woken by the server not the gui
+
+            msgs = self.client.receive_pairs()
+            if msgs:
+                self.received.append(msgs)
+                wx.CallAfter(self.receive_messages)
 
     def servo_command(self, command):
         if self.lastcommand != command or command != 0:
             self.lastcommand = command
-            self.client.set('servo.command', command)
+            self.set('servo.command', command)
 
     def send_gain(self, name, gain):
-        slidervalue = gain['slider'].GetValue() / 1000.0 * (gain['max'] - gain['min']) + gain['min']
-        self.client.set(name, slidervalue)
+        position = gain.position
+        if position == gain.sent:
+            return # server already has this value
+        gain.sent = position
+        slidervalue = position / 1000.0 * (gain.max - gain.min) + gain.min
+        self.set(name, slidervalue)
+
+    def start_timer(self, timer, period):
+        if not timer.IsRunning():
+            timer.Start(period)
+
+    def set_label(self, widget, label):
+        # avoid relayout and repaint when nothing changed
+        if widget.GetLabel() != label:
+            widget.SetLabel(label)
 
     def set_mode_color(self):
-        modecolors = {'compass': wx.GREEN, 'gps': wx.YELLOW,
-                      'wind': wx.BLUE, 'true wind': wx.CYAN}
-        if self.tbAP.GetValue() and self.mode in modecolors:
-            color = modecolors[self.mode]
+        if self.tbAP.GetValue() and self.mode in self.mode_colors:
+            color = self.mode_colors[self.mode]
         else:
             color = wx.RED
-        self.tbAP.SetForegroundColour(color)
+        if self.tbAP.GetForegroundColour() != color:
+            self.tbAP.SetForegroundColour(color)
 
     def enumerate_controls(self, value_list):
         self.tbAP.SetValue(False)
         self.set_mode_color()
-        
+
+        self.Freeze() # paint once after all gains are built
+        try:
+            self.build_controls(value_list)
+        finally:
+            self.Thaw()
+        self.enumerated = True
+        self.receive_messages() # anything that arrived while enumerating
+
+    def build_controls(self, value_list):
         self.fgGains.Clear(True)
         self.gains = {}
         pilots = {}
@@ -86,46 +217,50 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
             sname = name.split('.')
             if len(sname) > 2 and sname[0] == 'ap' and sname[1] == 'pilot':
                 pilots[sname[2]] = True
-                
-            if 'AutopilotGain' in value_list[name]:
-                sizer = wx.FlexGridSizer( 0, 1, 0, 0 )
-                sizer.AddGrowableRow( 2 )
-                sizer.SetFlexibleDirection( wx.VERTICAL )
-        
-                self.client.watch(name)
-                self.client.watch(name+'gain')
-
-                lname = name
-                sname = name.split('.')
-                if len(sname) > 3 and sname[0] == 'ap' and sname[1] == 'pilot':
-                    lname = sname[3]
-                stname = wx.StaticText( self.swGains, wx.ID_ANY, lname)
-                sizer.Add( stname, 0, wx.ALL, 5 )
-                stvalue = wx.StaticText( self.swGains, wx.ID_ANY, '   N/A   ')
-                sizer.Add( stvalue, 0, wx.ALL, 5 )
-        
-                hsizer = wx.FlexGridSizer( 1, 0, 0, 0 )
-                hsizer.AddGrowableRow( 0 )
-                hsizer.SetFlexibleDirection( wx.VERTICAL )
-        
-                gauge = wx.Gauge( self.swGains, wx.ID_ANY, 1000, wx.DefaultPosition, wx.Size( -1,-1 ), wx.SL_VERTICAL )
-                hsizer.Add( gauge, 0, wx.ALL|wx.EXPAND, 5 )
-                slider = wx.Slider( self.swGains, wx.ID_ANY, 0, 0, 1000, wx.DefaultPosition, wx.Size( -1,-1 ), wx.SL_VERTICAL| wx.SL_INVERSE)
-                hsizer.Add( slider, 0, wx.ALL|wx.EXPAND, 5 )
-        
-                sizer.Add( hsizer, 1, wx.EXPAND, 5 )
-
-                min_val, max_val = value_list[name]['min'], value_list[name]['max']
-                gain = {'stname': stname, 'stvalue': stvalue, 'gauge': gauge, 'slider': slider, 'min': min_val, 'max': max_val, 'need_update': False, 'last_change': 0, 'sliderval': 0, 'sizer': sizer}
-                self.gains[name] = gain
-                def make_ongain(gain):
-                    def do_gain(event):
-                        gain['need_update'] = True
-                        gain['last_change'] = time.monotonic()
-                    return do_gain
-                slider.Bind( wx.EVT_SCROLL, make_ongain(gain) )
-                
-        self.enumerate_gains()
+
+        # keep the server's order so each pilot's gains appear as registered
+        gains = [(name, info) for name, info in value_list.items() if 'AutopilotGain' in info]
+        for name, info in gains:
+            sizer = wx.FlexGridSizer( 0, 1, 0, 0 )
+            sizer.AddGrowableRow( 2 )
+            sizer.SetFlexibleDirection( wx.VERTICAL )
+    
+            self.watch(name)
+            self.watch(name+'gain')
+
+            lname = name
+            sname = name.split('.')
+            if len(sname) > 3 and sname[0] == 'ap' and sname[1] == 'pilot':
+                lname = sname[3]
+            stname = wx.StaticText( self.swGains, wx.ID_ANY, lname)
+            stvalue = wx.StaticText( self.swGains, wx.ID_ANY, '   N/A   ')
+    
+            hsizer = wx.FlexGridSizer( 1, 0, 0, 0 )
+            hsizer.AddGrowableRow( 0 )
+            hsizer.SetFlexibleDirection( wx.VERTICAL )
+    
+            gauge = wx.Gauge( self.swGains, wx.ID_ANY, 1000, wx.DefaultPosition, wx.Size( -1,-1 ), wx.SL_VERTICAL )
+            slider = wx.Slider( self.swGains, wx.ID_ANY, 0, 0, 1000, wx.DefaultPosition, wx.Size( -1,-1 ), wx.SL_VERTICAL| wx.SL_INVERSE)
+            hsizer.AddMany([( gauge, 0, wx.ALL|wx.EXPAND, 5 ),
+                            ( slider, 0, wx.ALL|wx.EXPAND, 5 )])
+    
+            sizer.AddMany([( stname, 0, wx.ALL, 5 ),
+                           ( stvalue, 0, wx.ALL, 5 ),
+                           ( hsizer, 1, wx.EXPAND, 5 )])
+
+            min_val, max_val = info['min'], info['max']
+            gain = AutopilotGainControl(stname, stvalue, gauge, slider, sizer, min_val, max_val)
+            self.gains[name] = gain
+            def make_ongain(gain):
+                def do_gain(event):
+                    gain.position = gain.slider.GetValue()
+                    gain.need_update = True
+                    gain.last_change = time.monotonic()
+                    self.start_timer(self.gain_timer, 200)
+                return do_gain
+            slider.Bind( wx.EVT_SCROLL, make_ongain(gain) )
+            
+        self.enumerate_gains(False)
 
         self.cPilot.Clear()
         for pilot in pilots:
@@ -134,20 +269,13 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
         self.GetSizer().Fit(self)
         self.SetSize(wx.Size(570, 420))
         
-    def receive_messages(self, event):
-        if not self.enumerated and self.client.connection:
-            value_list = self.client.list_values(10)
-            if value_list:
-                self.enumerate_controls(value_list)
-                self.enumerated = True
-            return
-        
-        command = self.sCommand.GetValue()
+    def command_tick(self, event):
+        command = self.command
         if command != 0:
             if self.tbAP.GetValue():
                 self.heading_command += self.apply_command(command)
-                self.client.set('ap.heading_command', self.heading_command)
                 self.sCommand.SetValue(0)
+                self.command = 0
             else:
                 
                 if True:
@@ -159,117 +287,171 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
                     if abs(command) < 3:
                         command=0
                 self.sCommand.SetValue(command)
+                self.command = command
                 self.servo_command(-command / 100.0)
 
+        # send heading command in half degree steps while the slider
+        # moves, and whatever is left over once it stops
+        delta = abs(self.heading_command - self.sent_heading_command)
+        if delta >= .5 or (delta and command == 0):
+            self.set('ap.heading_command', self.heading_command)
+            self.sent_heading_command = self.heading_command
+
+        if self.command == 0 and self.heading_command == self.sent_heading_command:
+            self.command_timer.Stop() # restarted by onCommand
+
+    def gain_tick(self, event):
+        busy = False
         for gain_name in self.gains:
             gain = self.gains[gain_name]
-            if gain['need_update']:
+            if gain.need_update:
                 self.send_gain(gain_name, gain)
-                gain['need_update'] = False
+                gain.need_update = False
                 
-            if gain['slider'].GetValue() != gain['sliderval'] and \
-               time.monotonic() - gain['last_change'] > 1:
-                gain['slider'].SetValue(gain['sliderval'])
+            if gain.position != gain.sliderval:
+                busy = True
+                if time.monotonic() - gain.last_change > 1:
+                    gain.slider.SetValue(gain.sliderval)
+                    gain.position = gain.sliderval
+
+        if not busy:
+            self.gain_timer.Stop() # restarted by slider or value changes
 
-        msgs = self.client.receive()
+    def receive_messages(self):
+        if not self.enumerated:
+            return
 
-        for name in msgs:
-            value = msgs[name]
+        msgs = []
+        while self.received:
+            msgs += self.received.popleft()
+
+        if len(msgs) > 1:
+            self.Freeze() # repaint once for the whole batch
+            try:
+                self.handle_messages(msgs)
+            finally:
+                self.Thaw()
+        elif msgs:
+            self.handle_messages(msgs)
+
+    def handle_messages(self, msgs):
+        for name, value in msgs:
             self.recv[name] = True
 
-            found = False
-
-            for gain_name in self.gains:
-                gain = self.gains[gain_name]
-                if name == gain_name:
-                    gain['stvalue'].SetLabel('%.5f' % value)
-                    gain['sliderval'] = (value-gain['min'])*1000/(gain['max'] - gain['min'])
-                    found = True
-                elif name == gain_name + 'gain':
-                    v = abs(value) * 1000.0
-                    if v < gain['gauge'].GetRange():
-                        gain['gauge'].SetValue(v)
-                        if value > 0:
-                            gain['gauge'].SetBackgroundColour(wx.RED)
-                        elif value < 0:
-                            gain['gauge'].SetBackgroundColour(wx.GREEN)
-                        else:
-                            gain['gauge'].SetBackgroundColour(wx.LIGHT_GREY)
+            if name in self.gains:
+                gain = self.gains[name]
+                if value == gain.value:
+                    continue
+                gain.value = value
+                gain.stvalue.SetLabel('%.5f' % value)
+                gain.sliderval = gain.sent = round((value-gain.min)*1000/(gain.max - gain.min))
+                if gain.position != gain.sliderval:
+                    self.start_timer(self.gain_timer, 200)
+            elif name[-4:] == 'gain' and name[:-4] in self.gains:
+                gain = self.gains[name[:-4]]
+                v = int(abs(value) * 1000.0)
+                if v < gain.gauge.GetRange():
+                    if value > 0:
+                        color = wx.RED
+                    elif value < 0:
+                        color = wx.GREEN
                     else:
-                        gain['gauge'].SetValue(0)
-                        gain['gauge'].SetBackgroundColour(wx.BLUE)
-
-                    found = True
-
-            if found:
-                pass
-#            elif name == 'servo.raw_command':
-#                self.tbAP.SetValue(False)
-#                self.tbAP.SetForegroundColour(wx.RED)
-            elif name == 'ap.enabled':
-                self.tbAP.SetValue(int(value))
-                self.set_mode_color()
-                self.apenabled = value
-                self.bCenter.Show(not self.apenabled and self.rudder)
-            elif name == 'rudder.angle':
-                try:
-                    value = round(value, 1)
-                except:
-                    pass
-                self.rudder = value
-                if (not (not self.apenabled and self.rudder)) == self.bCenter.IsShown():
-                    self.bCenter.Show(not self.bCenter.IsShown())
-                self.stRudder.SetLabel(str(value))
-            elif name == 'ap.mode':
-                rb = {'compass': self.rbCompass, 'gps': self.rbGPS, 'wind': self.rbWind, 'true wind': self.rbTrueWind}
-                rb[value].SetValue(True)
-                self.mode = value
-                self.set_mode_color()
-            elif name == 'ap.heading_command':
-                self.stHeadingCommand.SetLabel('%.1f' % value)
-                if command == 0:
-                    self.heading_command = value
-            elif name == 'ap.pilot':
-                self.cPilot.SetStringSelection(value)
-                self.enumerate_gains()
-            elif name == 'gps.source':
-                self.rbGPS.Enable(value != 'none')
-                self.rbTrueWind.Enable(value != 'none' and self.rbWind.IsEnabled())
-            elif name == 'wind.source':
-                self.rbWind.Enable(value != 'none')
-                self.rbTrueWind.Enable(value != 'none' and self.rbGPS.IsEnabled())
-            elif name == 'ap.heading':
-                self.stHeading.SetLabel('%.1f' % value)
-                self.heading = value
-            elif name == 'ap.tack.state':
-                self.stTackState.SetLabel(value)
-                self.bTack.SetLabel('Tack' if value == 'none' else 'Cancel')
-                self.tackstate = value
-            elif name == 'ap.tack.timeout':
-                if self.tackstate == 'waiting':
-                    self.stTackState.SetLabel(str(value))
-            elif name == 'ap.tack.direction':
-                self.cTackDirection.SetSelection(value == 'starboard')
-            elif name == 'servo.engaged':
-                self.stEngaged.SetLabel('Engaged' if value else 'Disengaged')
-            elif name == 'servo.flags':
-                self.stStatus.SetLabel(value)
-            elif name == 'servo.controller':
-                self.stController.SetLabel(value)
-            elif name == 'servo.current':
-                pass # timeout value to know we are receiving
+                        color = wx.LIGHT_GREY
+                else:
+                    v, color = 0, wx.BLUE
+                # only touch the gauge when the bar or color would change
+                if gain.gauge_state != (v, color):
+                    gain.gauge_state = v, color
+                    gain.gauge.SetValue(v)
+                    gain.gauge.SetBackgroundColour(color)
+            elif name in self.handlers:
+                self.handlers[name](value)
             elif 'ap.pilot.' in name:
                 pass
-            else:
+            elif not name in self.unhandled: # only warn once per name
+                self.unhandled.add(name)
                 print('warning: unhandled message "%s"' % name)
 
+    def update_enabled(self, value):
+        if self.tbAP.GetValue() != bool(value):
+            self.tbAP.SetValue(int(value))
+        self.set_mode_color()
+        self.apenabled = value
+        self.update_center()
+
+    def update_center(self):
+        # center is only useful with a rudder sensor while disengaged
+        show = bool(not self.apenabled and self.rudder)
+        if show != self.bCenter.IsShown():
+            self.bCenter.Show(show)
+
+    def update_rudder(self, value):
+        try:
+            value = round(value, 1)
+        except:
+            pass
+        self.rudder = value
+        self.update_center()
+        self.set_label(self.stRudder, str(value))
+
+    def update_mode(self, value):
+        self.mode_radios[value].SetValue(True)
+        self.mode = value
+        self.set_mode_color()
+
+    def update_heading_command(self, value):
+        self.set_label(self.stHeadingCommand, '%.1f' % value)
+        # keep local changes the server has not seen yet
+        if self.command == 0 and self.heading_command == self.sent_heading_command:
+            self.heading_command = self.sent_heading_command = value
+
+    def update_pilot(self, value):
+        self.cPilot.SetStringSelection(value)
+        self.enumerate_gains()
+
+    def update_gps_source(self, value):
+        self.rbGPS.Enable(value != 'none')
+        self.rbTrueWind.Enable(value != 'none' and self.rbWind.IsEnabled())
+
+    def update_wind_source(self, value):
+        self.rbWind.Enable(value != 'none')
+        self.rbTrueWind.Enable(value != 'none' and self.rbGPS.IsEnabled())
+
+    def update_heading(self, value):
+        self.set_label(self.stHeading, '%.1f' % value)
+        self.heading = value
+
+    def update_tack_state(self, value):
+        self.set_label(self.stTackState, value)
+        self.set_label(self.bTack, 'Tack' if value == 'none' else 'Cancel')
+        self.tackstate = value
+
+    def update_tack_timeout(self, value):
+        if self.tackstate == 'waiting':
+            self.set_label(self.stTackState, str(value))
+
+    def update_tack_direction(self, value):
+        self.cTackDirection.SetSelection(value == 'starboard')
+
+    def update_engaged(self, value):
+        self.set_label(self.stEngaged, 'Engaged' if value else 'Disengaged')
+
+    def update_flags(self, value):
+        self.set_label(self.stStatus, value)
+
+    def update_controller(self, value):
+        self.set_label(self.stController, value)
+
+    def update_current(self, value):
+        pass # timeout value to know we are receiving
+
     def onAP( self, event ):
         if self.tbAP.GetValue():
-            self.client.set('ap.heading_command', self.heading)
-            self.client.set('ap.enabled', True)
+            self.set('ap.heading_command', self.heading)
+            self.set('ap.enabled', True)
         else:
-            self.client.set('servo.command', 0)
-            self.client.set('ap.enabled', False)
+            self.set('servo.command', 0)
+            self.set('ap.enabled', False)
 
     def onMode( self, event):
         if self.rbGPS.GetValue():
@@ -280,20 +462,20 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
             mode = 'true wind'
         else:
             mode = 'compass'
-        self.client.set('ap.mode', mode)
+        self.set('ap.mode', mode)
 
     def onPilot(self, event):
-        self.client.set('ap.pilot', self.cPilot.GetStringSelection())
+        self.set('ap.pilot', self.cPilot.GetStringSelection())
 
     def onTack(self, event):
         if self.bTack.GetLabel() == 'Tack':
             self.tackstate = 'begin'
         else:
             self.tackstate = 'none'
-        self.client.set('ap.tack.state', self.tackstate)
+        self.set('ap.tack.state', self.tackstate)
 
     def onTackDirection(self, event):
-        self.client.set('ap.tack.direction', 'port' if self.cTackDirection.GetSelection() else 'starboard')
+        self.set('ap.tack.direction', 'port' if self.cTackDirection.GetSelection() else 'starboard')
 
     def onPaintControlSlider( self, event ):
         return
@@ -319,18 +501,22 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
             dc.DrawLine(x, 0, x, s.y)
             x += s.x / (len(self.sliderlabels) - 1)
 
-    def enumerate_gains(self):
+    def enumerate_gains(self, fit=True):
         while not self.fgGains.IsEmpty():
             self.fgGains.Detach(0)
 
         pilot = self.cPilot.GetStringSelection()
+        rows = []
         for name in self.gains:
             if pilot in name or not 'ap.pilot.' in name:
-                self.gains[name]['sizer'].ShowItems(True)
-                self.fgGains.Add( self.gains[name]['sizer'], 1, wx.EXPAND, 5 )
+                self.gains[name].sizer.ShowItems(True)
+                rows.append(( self.gains[name].sizer, 1, wx.EXPAND, 5 ))
             else:
-                self.gains[name]['sizer'].ShowItems(False)
+                self.gains[name].sizer.ShowItems(False)
+        self.fgGains.AddMany(rows)
 
+        if not fit:
+            return # caller lays out the whole window
         s = self.GetSize()
         self.Fit()
         self.SetSize(s)
@@ -345,13 +531,15 @@ class AutopilotControl(autopilot_control_ui.AutopilotControlBase):
         return v        
     
     def onCommand( self, event ):
+        self.start_timer(self.command_timer, 100)
         if wx.GetMouseState().LeftIsDown():
             x = self.sCommand.ScreenToClient(wx.GetMousePosition()).x
             val = self.sCommand.GetMin() + (self.sCommand.GetMax() - self.sCommand.GetMin()) * x / self.sCommand.GetSize().x
             self.sCommand.SetValue(val)
+        self.command = self.sCommand.GetValue()
 
     def onCenter( self, event ):
-        self.client.set('servo.position_command', 0)
+        self.set('servo.position_command', 0)
 
     def onScope( self, event ):
         subprocess.Popen(['pypilot_scope'] + sys.argv[1:])
@@ -48,12 +48,12 @@ class MainFrame(wx.Frame):
         self.bRefresh.Bind( wx.EVT_BUTTON, self.Refresh )
         bsizer.Add(self.bRefresh)
 
+        scope_args = [sys.executable,
+                      os.path.abspath(os.path.dirname(__file__)) +
+                      '/' + 'scope_wx.py'] + sys.argv[1:]
         self.bScope = wx.Button(self, wx.ID_ANY, 'Scope')
         self.bScope.Bind( wx.EVT_BUTTON,
-                          lambda event :
-                          subprocess.Popen(['python',
-                                            os.path.abspath(os.path.dirname(__file__)) +
-                                            '/' + 'scope_wx.py'] + sys.argv[1:]))
+                          lambda event : subprocess.Popen(scope_args))
         bsizer.Add(self.bScope)
 
         self.bClose = wx.Button(self, wx.ID_ANY, 'Close')